@@ -19,6 +19,9 @@ class Settings(BaseSettings):
     
     # Database Configuration
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./crm_chatbot.db")
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    db_pool_recycle: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
     
     # Vector Database Configuration
     chroma_db_path: str = os.getenv("CHROMA_DB_PATH", "./chroma_db")
@@ -41,6 +44,21 @@ class Settings(BaseSettings):
     chunk_size: int = 1000
     chunk_overlap: int = 200
     max_retrieval_docs: int = 5
+    query_cache_size: int = 1024
+    query_embedding_cache_size: int = 4096
+    semantic_cache_size: int = 512
+    semantic_cache_threshold: float = 0.97
+    background_ingestion: bool = os.getenv("BACKGROUND_INGESTION", "false").lower() == "true"
+    ingest_queue_size: int = 256
+    stats_cache_ttl: int = 30  # seconds before collection stats are recomputed from the stores
+    
+    # FAISS mirror of the vector store (used when faiss is installed)
+    faiss_index_path: str = os.getenv("FAISS_INDEX_PATH", "./chroma_db/faiss.index")
+    faiss_index_type: str = os.getenv("FAISS_INDEX_TYPE", "ivfpq")  # ivfpq, ivfsq8 (int8 codes), hnsw or flat
+    faiss_nprobe: int = 16
+    faiss_ef_search: int = 64  # HNSW candidate list size per query
+    faiss_checkpoint_vectors: int = 1000  # logged vectors before the full index is rewritten
+    faiss_checkpoint_seconds: int = 60
     
     # Chat Configuration
     max_conversation_history: int = 50
@@ -49,6 +67,9 @@ class Settings(BaseSettings):
     
     # Embedding Model
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    embedding_workers: int = int(os.getenv("EMBEDDING_WORKERS", str(os.cpu_count() or 1)))
+    embedding_backend: str = os.getenv("EMBEDDING_BACKEND", "torch")  # torch or onnx (int8-quantized)
+    onnx_model_dir: str = os.getenv("ONNX_MODEL_DIR", "./onnx_models")
 
 # Global settings instance
 settings = Settings() 
\ No newline at end of file
@@ -8,11 +8,18 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-# Create the database engine
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
-)
+# Create the database engine with a pooled, pre-pinged connection pool
+engine_options = {
+    "pool_pre_ping": True,
+    "pool_recycle": settings.db_pool_recycle
+}
+if "sqlite" in settings.database_url:
+    engine_options["connect_args"] = {"check_same_thread": False}
+else:
+    engine_options["pool_size"] = settings.db_pool_size
+    engine_options["max_overflow"] = settings.db_max_overflow
+
+engine = create_engine(settings.database_url, **engine_options)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -21,6 +28,12 @@ def create_tables():
     """Create all database tables."""
     try:
         Base.metadata.create_all(bind=engine)
+        
+        # create_all skips existing tables, so add any indexes introduced since they were created
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+        
         logger.info("Database tables created successfully")
     except Exception as e:
         logger.error(f"Error creating database tables: {e}")
@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 import logging
 import time
+import queue
 from typing import Optional, List
 import aiofiles
 import os
@@ -568,6 +569,8 @@ async def upload_documents(files: List[UploadFile] = File(...)):
         
         uploaded_docs = []
         replaced_docs = []
+        items = []
+        replacements = []
         
         for file in files:
             # Check if document already exists
@@ -585,17 +588,17 @@ async def upload_documents(files: List[UploadFile] = File(...)):
             # Determine content type and process accordingly
             if file.content_type == "text/csv":
                 # Process CSV file
-                doc_id = rag_service.process_csv_data(
+                item = rag_service.prepare_csv_document(
                     content.decode('utf-8'),
                     file.filename
                 )
             elif file.content_type == "text/plain":
                 # Process text file
-                doc_id = rag_service.process_document(
-                    content.decode('utf-8'),
-                    file.filename,
-                    file.content_type
-                )
+                item = {
+                    "content": content.decode('utf-8'),
+                    "filename": file.filename,
+                    "content_type": file.content_type
+                }
             elif file.content_type == "application/json" or file.filename.lower().endswith('.json'):
                 # Process JSON file
                 try:
@@ -608,12 +611,12 @@ async def upload_documents(files: List[UploadFile] = File(...)):
                     readable_text = _json_to_readable_text(parsed_json, file.filename)
                     
                     # Process the readable text
-                    doc_id = rag_service.process_document(
-                        readable_text,
-                        file.filename,
-                        file.content_type or "application/json",
-                        metadata={"original_format": "json", "has_structure": True}
-                    )
+                    item = {
+                        "content": readable_text,
+                        "filename": file.filename,
+                        "content_type": file.content_type or "application/json",
+                        "metadata": {"original_format": "json", "has_structure": True}
+                    }
                     
                 except json.JSONDecodeError as e:
                     logger.error(f"Invalid JSON in file {file.filename}: {e}")
@@ -653,12 +656,12 @@ async def upload_documents(files: List[UploadFile] = File(...)):
                         )
                     
                     # Process extracted text as document
-                    doc_id = rag_service.process_document(
-                        text_content,
-                        file.filename,
-                        file.content_type,
-                        metadata={"total_pages": len(pdf_reader.pages)}
-                    )
+                    item = {
+                        "content": text_content,
+                        "filename": file.filename,
+                        "content_type": file.content_type,
+                        "metadata": {"total_pages": len(pdf_reader.pages)}
+                    }
                     
                 except Exception as e:
                     logger.error(f"Error processing PDF {file.filename}: {e}")
@@ -669,17 +672,35 @@ async def upload_documents(files: List[UploadFile] = File(...)):
             else:
                 # For other file types, try to process as text
                 try:
-                    doc_id = rag_service.process_document(
-                        content.decode('utf-8'),
-                        file.filename,
-                        file.content_type or "text/plain"
-                    )
+                    item = {
+                        "content": content.decode('utf-8'),
+                        "filename": file.filename,
+                        "content_type": file.content_type or "text/plain"
+                    }
                 except UnicodeDecodeError:
                     raise HTTPException(
                         status_code=400,
                         detail=f"Unsupported file type: {file.content_type}"
                     )
             
+            items.append(item)
+            replacements.append(is_replacement)
+        
+        # Index all uploaded files in a single batch, or hand them to the background worker
+        if not items:
+            doc_ids = []
+        elif settings.background_ingestion:
+            try:
+                doc_ids = rag_service.submit_documents(items)
+            except queue.Full:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Indexing queue is full, please retry later"
+                )
+        else:
+            doc_ids = rag_service.process_documents(items)
+        
+        for file, doc_id, is_replacement in zip(files, doc_ids, replacements):
             doc_info = {
                 "filename": file.filename,
                 "document_id": doc_id,
@@ -699,6 +720,8 @@ async def upload_documents(files: List[UploadFile] = File(...)):
             message_parts.append(f"Successfully replaced {len(replaced_docs)} existing documents")
         
         message = "; ".join(message_parts) if message_parts else "No documents processed"
+        if items and settings.background_ingestion:
+            message += " (indexing in the background)"
         
         return APIResponse(
             success=True,
@@ -710,6 +733,8 @@ async def upload_documents(files: List[UploadFile] = File(...)):
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading documents: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 from typing import Optional, List, Dict, Any
-from sqlalchemy import Column, String, DateTime, Boolean, Text, Integer, ForeignKey, JSON
+from sqlalchemy import Column, String, DateTime, Boolean, Text, Integer, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
 
@@ -134,6 +134,22 @@ class UserSession(Base):
     # Relationships
     user = relationship("User")
     
+    __table_args__ = (
+        # Token lookups filter on session_token and is_active
+        Index("ix_user_sessions_token_active", "session_token", "is_active"),
+        # Active-session listing filters on user_id, is_active and a range over expires_at
+        Index("ix_user_sessions_user_active_expires", "user_id", "is_active", "expires_at", "created_at"),
+        # Full per-user session listing filters on user_id and orders by created_at
+        Index("ix_user_sessions_user_created", "user_id", "created_at"),
+        # Expired-session cleanup only ever scans active sessions, so index just those
+        Index(
+            "ix_user_sessions_expires_where_active",
+            "expires_at",
+            postgresql_where=is_active == True,
+            sqlite_where=is_active == True
+        ),
+    )
+    
     def to_dict(self):
         return {
             "id": self.id,
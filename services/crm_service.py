@@ -1,7 +1,9 @@
 import logging
+import functools
 from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, select
+from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime, timedelta
 from models.crm_models import User, Conversation, Message, UserSession
 from database import get_db_context
@@ -10,6 +12,25 @@ import secrets
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of sessions deactivated per UPDATE during cleanup
+SESSION_CLEANUP_BATCH_SIZE = 4096
+
+def db_safe(action: str, default: Any = None):
+    """Catch database errors raised by the wrapped method, log them and return a fallback.
+    
+    `default` is returned on error; pass a callable (e.g. `list`) to get a fresh value per call.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except SQLAlchemyError as e:
+                logger.error(f"Error {action}: {e}")
+                return default() if callable(default) else default
+        return wrapper
+    return decorator
+
 class CRMService:
     """Service class for CRM operations."""
     
@@ -663,134 +684,136 @@ class CRMService:
             logger.error(f"Error creating user session: {e}")
             raise
     
+    @db_safe("getting user session")
     def get_user_session(self, session_token: str) -> Optional[Dict[str, Any]]:
         """Get user session by token."""
-        try:
-            with get_db_context() as db:
-                user_session = db.query(UserSession).filter(
-                    UserSession.session_token == session_token,
-                    UserSession.is_active == True,
-                    UserSession.expires_at > datetime.utcnow()
-                ).first()
-                
-                if user_session:
-                    return {
-                        "session_id": user_session.id,
-                        "user_id": user_session.user_id,
-                        "session_token": user_session.session_token,
-                        "expires_at": user_session.expires_at.isoformat(),
-                        "created_at": user_session.created_at.isoformat()
-                    }
-                
+        now = datetime.utcnow()
+        with get_db_context() as db:
+            user_session = db.query(UserSession).filter(
+                UserSession.session_token == session_token,
+                UserSession.is_active == True,
+                UserSession.expires_at > now
+            ).first()
+            
+            if user_session is None:
                 return None
-                
-        except Exception as e:
-            logger.error(f"Error getting user session: {e}")
-            return None
+            
+            return {
+                "session_id": user_session.id,
+                "user_id": user_session.user_id,
+                "session_token": user_session.session_token,
+                "expires_at": user_session.expires_at.isoformat(),
+                "created_at": user_session.created_at.isoformat()
+            }
     
+    @db_safe("validating session")
     def validate_session(self, session_token: str) -> Optional[User]:
         """Validate session token and return user if valid."""
-        try:
-            with get_db_context() as db:
-                user_session = db.query(UserSession).filter(
-                    UserSession.session_token == session_token,
-                    UserSession.is_active == True,
-                    UserSession.expires_at > datetime.utcnow()
-                ).first()
-                
-                if user_session:
-                    user = db.query(User).filter(User.id == user_session.user_id).first()
-                    return user
-                
+        now = datetime.utcnow()
+        with get_db_context() as db:
+            user_session = db.query(UserSession).filter(
+                UserSession.session_token == session_token,
+                UserSession.is_active == True,
+                UserSession.expires_at > now
+            ).first()
+            
+            if user_session is None:
                 return None
-                
-        except Exception as e:
-            logger.error(f"Error validating session: {e}")
-            return None
+            
+            return db.query(User).filter(User.id == user_session.user_id).first()
     
+    @db_safe("extending session", default=False)
     def extend_session(self, session_token: str, extend_hours: int = 24) -> bool:
         """Extend session expiration time."""
-        try:
-            with get_db_context() as db:
-                user_session = db.query(UserSession).filter(
-                    UserSession.session_token == session_token,
-                    UserSession.is_active == True
-                ).first()
-                
-                if user_session:
-                    user_session.expires_at = datetime.utcnow() + timedelta(hours=extend_hours)
-                    db.commit()
-                    logger.info(f"Extended session {user_session.id} by {extend_hours} hours")
-                    return True
-                
-                return False
-                
-        except Exception as e:
-            logger.error(f"Error extending session: {e}")
-            return False
+        now = datetime.utcnow()
+        with get_db_context() as db:
+            # Single UPDATE on the unique session_token; the row count tells us if it matched
+            updated = db.query(UserSession).filter(
+                UserSession.session_token == session_token,
+                UserSession.is_active == True
+            ).update(
+                {UserSession.expires_at: now + timedelta(hours=extend_hours)},
+                synchronize_session=False
+            )
+            db.commit()
+            
+            if updated:
+                logger.info(f"Extended session by {extend_hours} hours")
+            return updated > 0
     
+    @db_safe("revoking session", default=False)
     def revoke_session(self, session_token: str) -> bool:
         """Revoke/deactivate a session."""
-        try:
-            with get_db_context() as db:
-                user_session = db.query(UserSession).filter(
-                    UserSession.session_token == session_token,
-                    UserSession.is_active == True
-                ).first()
-                
-                if user_session:
-                    user_session.is_active = False
-                    db.commit()
-                    logger.info(f"Revoked session {user_session.id}")
-                    return True
-                
-                return False
-                
-        except Exception as e:
-            logger.error(f"Error revoking session: {e}")
-            return False
+        with get_db_context() as db:
+            # Single UPDATE on the unique session_token; the row count tells us if it matched
+            updated = db.query(UserSession).filter(
+                UserSession.session_token == session_token,
+                UserSession.is_active == True
+            ).update({UserSession.is_active: False}, synchronize_session=False)
+            db.commit()
+            
+            if updated:
+                logger.info("Revoked session")
+            return updated > 0
     
+    @db_safe("getting user sessions", default=list)
     def get_user_sessions(self, user_id: str, active_only: bool = True) -> List[Dict[str, Any]]:
         """Get all sessions for a user."""
-        try:
-            with get_db_context() as db:
-                query = db.query(UserSession).filter(UserSession.user_id == user_id)
-                
-                if active_only:
-                    query = query.filter(
-                        UserSession.is_active == True,
-                        UserSession.expires_at > datetime.utcnow()
-                    )
-                
-                sessions = query.order_by(desc(UserSession.created_at)).all()
-                
-                return [session.to_dict() for session in sessions]
-                
-        except Exception as e:
-            logger.error(f"Error getting user sessions: {e}")
-            return []
+        now = datetime.utcnow()
+        with get_db_context() as db:
+            # Select plain columns and stream rows instead of materializing ORM objects
+            query = db.query(
+                UserSession.id,
+                UserSession.user_id,
+                UserSession.session_token,
+                UserSession.created_at,
+                UserSession.expires_at,
+                UserSession.is_active
+            ).filter(UserSession.user_id == user_id)
+            
+            if active_only:
+                query = query.filter(
+                    UserSession.is_active == True,
+                    UserSession.expires_at > now
+                )
+            
+            return [
+                {
+                    "id": row.id,
+                    "user_id": row.user_id,
+                    "session_token": row.session_token,
+                    "created_at": row.created_at.isoformat() if row.created_at else None,
+                    "expires_at": row.expires_at.isoformat() if row.expires_at else None,
+                    "is_active": row.is_active
+                }
+                for row in query.order_by(desc(UserSession.created_at)).yield_per(500)
+            ]
     
+    @db_safe("cleaning up expired sessions", default=0)
     def cleanup_expired_sessions(self) -> int:
         """Clean up expired sessions."""
-        try:
-            with get_db_context() as db:
-                expired_sessions = db.query(UserSession).filter(
-                    UserSession.expires_at < datetime.utcnow(),
+        now = datetime.utcnow()
+        with get_db_context() as db:
+            count = 0
+            
+            # Deactivate in bounded batches so each UPDATE holds its locks briefly
+            while True:
+                expired_ids = select(UserSession.id).where(
+                    UserSession.expires_at < now,
                     UserSession.is_active == True
-                ).all()
-                
-                count = len(expired_sessions)
-                
-                for session in expired_sessions:
-                    session.is_active = False
+                ).limit(SESSION_CLEANUP_BATCH_SIZE)
                 
+                updated = db.query(UserSession).filter(
+                    UserSession.id.in_(expired_ids)
+                ).update({UserSession.is_active: False}, synchronize_session=False)
                 db.commit()
-                logger.info(f"Cleaned up {count} expired sessions")
-                return count
                 
-        except Exception as e:
-            logger.error(f"Error cleaning up expired sessions: {e}")
-            return 0
+                count += updated
+                if updated < SESSION_CLEANUP_BATCH_SIZE:
+                    break
+            
+            logger.info(f"Cleaned up {count} expired sessions")
+            return count
 
 # Global CRM service instance
 crm_service = CRMService() 
\ No newline at end of file
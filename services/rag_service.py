@@ -1,18 +1,184 @@
+import io
 import os
+import sys
+import uuid
+import bisect
 import logging
-from typing import List, Dict, Any, Optional
+import functools
+import threading
+import queue
+import time
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import chromadb
 from chromadb.config import Settings
+from chromadb.api.client import SharedSystemClient
 from sentence_transformers import SentenceTransformer
+import numpy as np
+import torch
 import pandas as pd
 import json
 from datetime import datetime
 from config import settings
 from models.crm_models import Document
 from database import get_db_context
+from services.vector_index import FaissIndex
+from services.settings_service import settings_service
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # PyArrow is optional; CSV parsing falls back to pandas without it
+    pa = None
 
 logger = logging.getLogger(__name__)
 
+# Texts per forward pass when embedding
+EMBEDDING_BATCH_SIZE = 64
+# Maximum number of queued documents indexed together by the background ingest worker
+INGEST_BATCH_SIZE = 32
+
+# Held by sharded encodes while they change torch's process-wide intra-op thread count
+_sharded_encode_lock = threading.Lock()
+
+# Embeddings are L2-normalized at encode time, so inner product equals cosine similarity
+COLLECTION_NAME = "knowledge_base"
+# A re-indexed copy is built under this name and swapped in once complete
+REBUILD_COLLECTION_NAME = "knowledge_base_rebuild"
+COLLECTION_METADATA = {"hnsw:space": "ip", "hnsw:construction_ef": 200, "hnsw:M": 32}
+
+# Columns of the property listing CSV that feed the row descriptions
+ASSOCIATE_COLUMNS = [f'Associate {i}' for i in range(1, 5)]
+PROPERTY_COLUMNS = [
+    'Property Address', 'Floor', 'Suite', 'Size (SF)', 'Rent/SF/Year',
+    'Annual Rent', 'Monthly Rent', 'GCI On 3 Years', 'BROKER Email ID'
+] + ASSOCIATE_COLUMNS
+
+class ONNXEmbeddingModel:
+    """Sentence embedding model served by ONNX Runtime with dynamically int8-quantized weights.
+    
+    Exposes the subset of SentenceTransformer.encode used by RAGService.
+    """
+    
+    def __init__(self, model_name: str, model_dir: str):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTOptimizer, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoOptimizationConfig, AutoQuantizationConfig
+        from transformers import AutoTokenizer
+        
+        quantized_dir = os.path.join(model_dir, model_name.replace('/', '__') + '-o2-int8')
+        
+        # Export, fuse and quantize once; later processes load the final graph from disk.
+        # O2 fuses attention, LayerNorm and GELU into single kernels without changing numerics;
+        # the fused graph is then quantized so the remaining MatMuls use int8 (VNNI) kernels.
+        if not os.path.isdir(quantized_dir):
+            model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            ORTOptimizer.from_pretrained(model).optimize(
+                save_dir=quantized_dir,
+                optimization_config=AutoOptimizationConfig.O2()
+            )
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(quantized_dir)
+            ORTQuantizer.from_pretrained(quantized_dir, file_name="model_optimized.onnx").quantize(
+                save_dir=quantized_dir,
+                quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=True)
+            )
+        
+        self.model = ORTModelForFeatureExtraction.from_pretrained(quantized_dir, file_name="model_optimized_quantized.onnx")
+        self.tokenizer = AutoTokenizer.from_pretrained(quantized_dir)
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        """Size of the produced embeddings."""
+        return self.model.config.hidden_size
+    
+    def encode(self, texts: List[str], batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, show_progress_bar: bool = False) -> np.ndarray:
+        """Embed texts with mean pooling over token embeddings."""
+        # Batch texts of similar length together so each batch pads to a short maximum,
+        # as SentenceTransformer.encode does; results are returned in input order
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        sorted_texts = [texts[i] for i in order]
+        
+        batches = []
+        for i in range(0, len(sorted_texts), batch_size):
+            inputs = self.tokenizer(sorted_texts[i:i + batch_size], padding=True, truncation=True, return_tensors='np')
+            token_embeddings = self.model(**inputs).last_hidden_state
+            
+            mask = inputs['attention_mask'][..., None].astype(np.float32)
+            embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            
+            if normalize_embeddings:
+                embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+            batches.append(embeddings.astype(np.float32))
+        
+        if not batches:
+            return np.empty((0, 0), dtype=np.float32)
+        
+        embeddings = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        embeddings[order] = np.concatenate(batches)
+        return embeddings
+
+def _utf8_size(text: str) -> int:
+    """Size of text in UTF-8 bytes, without encoding it when it is pure ASCII."""
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+def _read_property_csv(csv_content: str) -> pd.DataFrame:
+    """Parse the description columns of a property CSV as plain strings (no dtype inference).
+    
+    Uses PyArrow's multi-threaded reader when it is installed, falling back to pandas for
+    input it rejects (e.g. duplicate column names).
+    """
+    if pa is not None:
+        try:
+            table = pa_csv.read_csv(
+                pa.BufferReader(csv_content.encode('utf-8')),
+                read_options=pa_csv.ReadOptions(use_threads=True, block_size=1 << 20),
+                convert_options=pa_csv.ConvertOptions(
+                    include_columns=PROPERTY_COLUMNS,
+                    include_missing_columns=True,
+                    column_types={column: pa.string() for column in PROPERTY_COLUMNS},
+                    strings_can_be_null=True
+                )
+            )
+            return table.to_pandas()
+        except pa.ArrowInvalid as e:
+            logger.debug(f"PyArrow could not parse CSV, falling back to pandas: {e}")
+    
+    return pd.read_csv(
+        io.StringIO(csv_content),
+        usecols=lambda column: column in PROPERTY_COLUMNS,
+        dtype=str
+    )
+
+@functools.lru_cache(maxsize=1)
+def _get_embedding_model():
+    """Load the configured embedding model once per process (PyTorch in half precision on CUDA)."""
+    if settings.embedding_backend == "onnx":
+        try:
+            return ONNXEmbeddingModel(settings.embedding_model, settings.onnx_model_dir)
+        except ImportError as e:
+            logger.warning(f"ONNX Runtime embedding backend unavailable (needs optimum[onnxruntime]), using PyTorch: {e}")
+    
+    model = SentenceTransformer(settings.embedding_model)
+    if torch.cuda.is_available():
+        model = model.half().to('cuda')
+    model.eval()
+    return model
+
+@functools.lru_cache(maxsize=settings.query_embedding_cache_size)
+def _embed_query(query: str) -> np.ndarray:
+    """Embed a single query, keeping recent embeddings (they do not depend on the indexed corpus)."""
+    embedding = _get_embedding_model().encode(
+        [query],
+        batch_size=1,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False
+    )
+    # The cached array is shared between callers
+    embedding = np.ascontiguousarray(embedding, dtype=np.float32)
+    embedding.setflags(write=False)
+    return embedding
+
 class RAGService:
     """RAG service for document processing and retrieval."""
     
@@ -20,28 +186,94 @@ class RAGService:
         self.chroma_client = None
         self.collection = None
         self.embedding_model = None
+        self.vector_index: Optional[FaissIndex] = None
+        
+        # Retrieval caches: exact (normalized query, n_results) hits and near-duplicate query hits
+        self._query_cache: "OrderedDict[Tuple[str, int], List[Dict[str, Any]]]" = OrderedDict()
+        self._semantic_cache_embeddings: Optional[np.ndarray] = None
+        self._semantic_cache_sizes: Optional[np.ndarray] = None
+        self._semantic_cache_results: List[Optional[List[Dict[str, Any]]]] = []
+        self._semantic_cache_next = 0
+        
+        # Bumped on every invalidation, so results read before a write are not cached after it
+        self._cache_generation = 0
+        
+        # Collection stats snapshot (monotonic time taken, stats), kept current by the writers
+        self._stats_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        self._stats_lock = threading.Lock()
+        
+        # Writes to the vector stores and FAISS searches are serialized; the caches have their own lock
+        self._index_lock = threading.RLock()
+        self._cache_lock = threading.Lock()
+        
+        # Documents submitted for background indexing (bounded; submissions are refused when it is full)
+        self._ingest_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=settings.ingest_queue_size)
+        self._ingest_thread: Optional[threading.Thread] = None
+        self._ingest_lock = threading.Lock()
+        
         self.initialize()
+        
+        # Under a pre-forking server (gunicorn --preload) the worker inherits the model weights
+        # loaded here, so a worker restarted by the master does not reload the model; the worker
+        # re-opens everything else. Run a single worker: the FAISS mirror and the caches are per
+        # process and not kept in sync, so --preload saves worker restart cost only.
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reopen_after_fork)
+    
+    def _create_chroma_client(self):
+        """Open the persistent ChromaDB client."""
+        return chromadb.PersistentClient(
+            path=settings.chroma_db_path,
+            settings=Settings(
+                anonymized_telemetry=False,
+                allow_reset=True
+            )
+        )
+    
+    def _reopen_after_fork(self):
+        """Re-create per-process state in a forked worker, keeping only the loaded model.
+        
+        The parent's FAISS mirror, caches and stats date from when it started; a worker
+        restarted later must see what earlier workers indexed since then.
+        """
+        self._stats_lock = threading.Lock()
+        self._index_lock = threading.RLock()
+        self._cache_lock = threading.Lock()
+        self._ingest_queue = queue.Queue(maxsize=settings.ingest_queue_size)
+        self._ingest_thread = None
+        self._ingest_lock = threading.Lock()
+        self._stats_cache = None
+        self._invalidate_query_cache()
+        
+        if self.chroma_client is not None:
+            # Chroma caches one client system per path; drop the parent's before reconnecting
+            SharedSystemClient.clear_system_cache()
+            self.chroma_client = self._create_chroma_client()
+            self.collection = self.chroma_client.get_collection(COLLECTION_NAME)
+            
+            # Rebuild the mirror from the current collection and index files
+            self.vector_index = None
+            if FaissIndex.available():
+                try:
+                    self.vector_index = self._load_index()
+                except Exception as e:
+                    logger.error(f"Failed to load FAISS index in worker, using ChromaDB for retrieval: {e}")
     
     def initialize(self):
         """Initialize the RAG service."""
         try:
             # Initialize ChromaDB
-            self.chroma_client = chromadb.PersistentClient(
-                path=settings.chroma_db_path,
-                settings=Settings(
-                    anonymized_telemetry=False,
-                    allow_reset=True
-                )
-            )
+            self.chroma_client = self._create_chroma_client()
+            
+            # Initialize embedding model (shared across service instances)
+            self.embedding_model = _get_embedding_model()
             
             # Get or create collection
-            self.collection = self.chroma_client.get_or_create_collection(
-                name="knowledge_base",
-                metadata={"hnsw:space": "cosine"}
-            )
+            self.collection = self._get_or_create_collection()
             
-            # Initialize embedding model
-            self.embedding_model = SentenceTransformer(settings.embedding_model)
+            # Mirror the collection into an in-process FAISS index when faiss is installed
+            if FaissIndex.available():
+                self.vector_index = self._load_index()
             
             logger.info("RAG service initialized successfully")
             
@@ -49,8 +281,103 @@ class RAGService:
             logger.error(f"Failed to initialize RAG service: {e}")
             raise
     
+    def _get_or_create_collection(self):
+        """Get the knowledge base collection, re-indexing it if it uses an older distance space."""
+        # Read the existing collection as stored: get_or_create_collection would overwrite its
+        # metadata with COLLECTION_METADATA before the distance space could be checked
+        try:
+            collection = self.chroma_client.get_collection(name=COLLECTION_NAME)
+        except ValueError:
+            # A rebuild interrupted after dropping the old collection left the complete copy
+            try:
+                collection = self.chroma_client.get_collection(name=REBUILD_COLLECTION_NAME)
+            except ValueError:
+                return self.chroma_client.create_collection(
+                    name=COLLECTION_NAME,
+                    metadata=COLLECTION_METADATA
+                )
+            collection.modify(name=COLLECTION_NAME)
+            return collection
+        
+        if (collection.metadata or {}).get("hnsw:space") != COLLECTION_METADATA["hnsw:space"]:
+            collection = self._rebuild_collection(collection)
+        
+        return collection
+    
+    def _rebuild_collection(self, old_collection):
+        """Re-embed the stored chunks into a collection with the current metadata, then swap it in.
+        
+        The new collection is filled under a temporary name and the old one is only deleted once
+        it is complete, so a failure part-way leaves the knowledge base untouched.
+        """
+        try:
+            self.chroma_client.delete_collection(REBUILD_COLLECTION_NAME)  # Left by an earlier failed attempt
+        except ValueError:
+            pass
+        collection = self.chroma_client.create_collection(
+            name=REBUILD_COLLECTION_NAME,
+            metadata=COLLECTION_METADATA
+        )
+        
+        # Page through the old collection rather than loading every chunk at once
+        batch_size = 5000
+        total = old_collection.count()
+        for offset in range(0, total, batch_size):
+            items = old_collection.get(offset=offset, limit=batch_size, include=["documents", "metadatas"])
+            if items['ids']:
+                self._add_to_collection(
+                    collection, items['ids'], items['documents'],
+                    self._embed_texts(items['documents']), items['metadatas']
+                )
+        
+        self.chroma_client.delete_collection(COLLECTION_NAME)
+        collection.modify(name=COLLECTION_NAME)
+        
+        logger.info(f"Re-indexed {total} chunks into {COLLECTION_METADATA['hnsw:space']} space")
+        return collection
+    
+    def _add_to_collection(self, collection, ids: List[str], documents: List[str],
+                           embeddings: np.ndarray, metadatas: List[Dict[str, Any]]):
+        """Add chunks to a collection in slices that stay under ChromaDB's max batch size."""
+        batch_size = 5000
+        for i in range(0, len(ids), batch_size):
+            collection.add(
+                documents=documents[i:i + batch_size],
+                embeddings=embeddings[i:i + batch_size].tolist(),
+                ids=ids[i:i + batch_size],
+                metadatas=metadatas[i:i + batch_size]
+            )
+    
+    def _load_index(self) -> FaissIndex:
+        """Build the FAISS mirror of the collection, reusing the persisted index when it is current."""
+        dimension = self.embedding_model.get_sentence_embedding_dimension()
+        index = FaissIndex(dimension, settings.faiss_index_path)
+        
+        # Make the SIMD level of the faiss build visible so a fallback to a generic build shows up in logs
+        logger.info(f"FAISS compile options: {FaissIndex.compile_options()}")
+        if dimension % 16:
+            logger.warning(f"Embedding dimension {dimension} is not a multiple of 16; FAISS distance kernels will run a scalar tail")
+        
+        items = self.collection.get(include=["metadatas"])
+        if index.load(items['ids']):
+            index.register(items['ids'], items['metadatas'])
+            return index
+        
+        # Re-add the stored vectors; the index switches to IVF if there are enough of them
+        items = self.collection.get(include=["embeddings", "metadatas"])
+        if items['ids']:
+            index.add(items['ids'], np.array(items['embeddings']), items['metadatas'])
+            index.save()
+        
+        return index
+    
     def remove_document_by_filename(self, filename: str) -> bool:
         """Remove a document and its chunks by filename."""
+        with self._index_lock:
+            return self._remove_document_by_filename(filename)
+    
+    def _remove_document_by_filename(self, filename: str) -> bool:
+        """Remove a document and its chunks by filename (caller holds the index lock)."""
         try:
             from database import get_db_context
             from models.crm_models import Document
@@ -68,25 +395,29 @@ class RAGService:
                     
                     # Get all chunks related to this document from ChromaDB
                     # Query ChromaDB for chunks with this filename
+                    removed_chunks = 0
                     try:
-                        # Get all items in collection
-                        all_items = self.collection.get()
-                        
-                        # Find chunks that belong to this document
-                        chunk_ids_to_delete = []
-                        for i, metadata in enumerate(all_items['metadatas']):
-                            if metadata and metadata.get('filename') == filename:
-                                chunk_ids_to_delete.append(all_items['ids'][i])
+                        # Let Chroma filter on metadata and return ids only
+                        chunk_ids_to_delete = self.collection.get(
+                            where={"filename": filename},
+                            include=[]
+                        )['ids']
                         
                         # Delete chunks from ChromaDB
                         if chunk_ids_to_delete:
                             self.collection.delete(ids=chunk_ids_to_delete)
+                            if self.vector_index is not None:
+                                self.vector_index.remove(chunk_ids_to_delete)
+                                self.vector_index.save()
+                            removed_chunks = len(chunk_ids_to_delete)
                             logger.info(f"Removed {len(chunk_ids_to_delete)} chunks for document: {filename}")
                         
                     except Exception as e:
                         logger.warning(f"Error removing chunks from ChromaDB for {filename}: {e}")
                     
                     db.commit()
+                    self._invalidate_query_cache()
+                    self._update_stats(documents=-1, chunks=-removed_chunks, size=-(existing_doc.file_size or 0))
                     logger.info(f"Document removed from database: {filename}")
                     return True
                     
@@ -95,214 +426,480 @@ class RAGService:
         
         return False
     
+    def _encode(self, texts: List[str], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Embed a list of texts in batched forward passes.
+        
+        Returns a C-contiguous float32 array (the layout FAISS takes without copying),
+        written into `out` when given.
+        """
+        embeddings = self.embedding_model.encode(
+            texts,
+            batch_size=EMBEDDING_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        if out is None:
+            return np.ascontiguousarray(embeddings, dtype=np.float32)
+        out[...] = embeddings
+        return out
+    
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Embed a list of texts, sharding inputs larger than a few batches across threads."""
+        # ONNX Runtime already spreads each run over its own intra-op threads, so only the
+        # PyTorch CPU backend is sharded
+        workers = min(settings.embedding_workers, len(texts) // EMBEDDING_BATCH_SIZE)
+        if workers < 2 or torch.cuda.is_available() or isinstance(self.embedding_model, ONNXEmbeddingModel):
+            return self._encode(texts)
+        
+        # Warm the tokenizer first: concurrent first calls race to configure padding/truncation
+        self._encode(texts[:1])
+        
+        # Each shard writes its rows straight into one preallocated result array
+        bounds = np.linspace(0, len(texts), workers + 1, dtype=int)
+        embeddings = np.empty((len(texts), self.embedding_model.get_sentence_embedding_dimension()), dtype=np.float32)
+        
+        def encode_shard(i: int) -> np.ndarray:
+            return self._encode(texts[bounds[i]:bounds[i + 1]], out=embeddings[bounds[i]:bounds[i + 1]])
+        
+        # Inference releases the GIL; one intra-op thread per worker avoids oversubscribing cores.
+        # The thread count is process-wide, so overlapping sharded encodes are serialized to keep
+        # one from restoring it while another still runs (or restoring the other's setting).
+        with _sharded_encode_lock:
+            previous_threads = torch.get_num_threads()
+            torch.set_num_threads(1)
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    list(executor.map(encode_shard, range(workers)))
+            finally:
+                torch.set_num_threads(previous_threads)
+        
+        return embeddings
+    
     def process_document(self, content: str, filename: str, content_type: str, 
-                        metadata: Optional[Dict[str, Any]] = None) -> str:
+                        metadata: Optional[Dict[str, Any]] = None,
+                        pre_chunked: Optional[List[str]] = None) -> str:
         """Process and index a document. If document exists, replace it."""
+        return self.process_documents([{
+            "content": content,
+            "filename": filename,
+            "content_type": content_type,
+            "metadata": metadata,
+            "pre_chunked": pre_chunked
+        }])[0]
+    
+    def process_documents(self, items: List[Dict[str, Any]]) -> List[str]:
+        """Process and index several documents in one batch, replacing existing ones.
+        
+        Each item holds `content`, `filename`, `content_type` and optionally `metadata`,
+        `pre_chunked` and a pre-assigned document `id`. All chunks are embedded and added to the vector store together,
+        and the database rows are written with a single bulk insert.
+        """
+        # A file given twice must be replaced in order, so it starts the next batch instead
+        document_ids = []
+        batch = []
+        filenames = set()
+        for item in items:
+            if item["filename"] in filenames:
+                document_ids.extend(self._process_batch(batch))
+                batch = []
+                filenames = set()
+            batch.append(item)
+            filenames.add(item["filename"])
+        
+        if batch:
+            document_ids.extend(self._process_batch(batch))
+        return document_ids
+    
+    def _process_batch(self, items: List[Dict[str, Any]]) -> List[str]:
+        """Index a batch of documents with distinct filenames."""
         try:
-            # Remove existing document if it exists
-            self.remove_document_by_filename(filename)
-            
-            # Generate document ID
-            doc_id = f"{filename}_{datetime.now().timestamp()}"
-            
-            # Split content into chunks
-            chunks = self._split_text(content)
-            
-            # Create embeddings and store in vector database
             chunk_ids = []
             chunk_texts = []
             chunk_metadata = []
+            document_rows = []
+            indexed_at = datetime.utcnow()
             
-            for i, chunk in enumerate(chunks):
-                chunk_id = f"{doc_id}_chunk_{i}"
-                chunk_ids.append(chunk_id)
-                chunk_texts.append(chunk)
+            for item in items:
+                # Shared per-document values are interned so every chunk's metadata
+                # references the same string objects
+                filename = sys.intern(item["filename"])
+                content = item["content"]
+                content_type = sys.intern(item["content_type"])
+                metadata = item.get("metadata")
                 
-                chunk_meta = {
-                    "filename": filename,
-                    "content_type": content_type,
-                    "chunk_index": i,
-                    "total_chunks": len(chunks),
-                    "created_at": datetime.now().isoformat()
-                }
+                # Remove existing document if it exists
+                self.remove_document_by_filename(filename)
                 
-                if metadata:
-                    chunk_meta.update(metadata)
+                # Generate document ID and creation time once per document; chunk metadata
+                # stores the creation time as integer nanoseconds since the epoch
+                created_at = time.time_ns()
+                doc_id = f"{filename}_{created_at}"
                 
-                chunk_metadata.append(chunk_meta)
+                # Split content into chunks unless the caller already did
+                chunks = item.get("pre_chunked") or self._split_text(content)
+                total_chunks = len(chunks)
+                
+                for i, chunk in enumerate(chunks):
+                    chunk_ids.append(f"{doc_id}_chunk_{i}")
+                    chunk_texts.append(chunk)
+                    
+                    chunk_meta = {
+                        "filename": filename,
+                        "content_type": content_type,
+                        "chunk_index": i,
+                        "total_chunks": total_chunks,
+                        "created_at": created_at
+                    }
+                    
+                    if metadata:
+                        chunk_meta.update(metadata)
+                    
+                    chunk_metadata.append(chunk_meta)
+                
+                document_rows.append({
+                    "id": item.get("id") or str(uuid.uuid4()),
+                    "filename": filename,
+                    "content_type": content_type,
+                    "content": content,
+                    "doc_metadata": metadata,
+                    "file_size": _utf8_size(content),
+                    "indexed_at": indexed_at
+                })
             
-            # Add to ChromaDB
-            self.collection.add(
-                documents=chunk_texts,
-                ids=chunk_ids,
-                metadatas=chunk_metadata
-            )
+            # Embed every chunk of the batch at once and add to ChromaDB
+            embeddings = self._embed_texts(chunk_texts) if chunk_texts else None
+            with self._index_lock:
+                if chunk_texts:
+                    self._add_to_collection(self.collection, chunk_ids, chunk_texts, embeddings, chunk_metadata)
+                    if self.vector_index is not None:
+                        self.vector_index.add(chunk_ids, embeddings, chunk_metadata)
+                        self.vector_index.save()
+                
+                self._invalidate_query_cache()
             
-            # Store document in database
+            # Store all documents with one bulk insert (no per-object unit-of-work or identity map)
             with get_db_context() as db:
-                document = Document(
-                    filename=filename,
-                    content_type=content_type,
-                    content=content,
-                    doc_metadata=metadata,
-                    file_size=len(content.encode('utf-8')),
-                    indexed_at=datetime.utcnow()
-                )
-                db.add(document)
+                db.bulk_insert_mappings(Document, document_rows)
                 db.commit()
-                
-                logger.info(f"Document processed successfully: {filename}")
-                return document.id
-                
+            
+            self._update_stats(
+                documents=len(document_rows),
+                chunks=len(chunk_ids),
+                size=sum(row["file_size"] for row in document_rows),
+                last_updated=max((row["indexed_at"] for row in document_rows), default=None)
+            )
+            
+            logger.info(f"Processed {len(document_rows)} document(s): {', '.join(row['filename'] for row in document_rows)}")
+            return [row["id"] for row in document_rows]
+            
         except Exception as e:
-            logger.error(f"Error processing document {filename}: {e}")
+            logger.error(f"Error processing documents: {e}")
             raise
     
+    def submit_documents(self, items: List[Dict[str, Any]]) -> List[str]:
+        """Queue documents for indexing on a background thread and return their ids immediately.
+        
+        Items take the same form as for `process_documents`; the returned ids are the ids the
+        database rows will have once the worker has indexed them. Never blocks: raises
+        `queue.Full`, queueing none of the documents, when the queue has no room for all of them.
+        """
+        items = [dict(item, id=item.get("id") or str(uuid.uuid4())) for item in items]
+        
+        # Only submitters add to the queue, so its free space cannot shrink while the lock is held
+        with self._ingest_lock:
+            if self._ingest_thread is None or not self._ingest_thread.is_alive():
+                self._ingest_thread = threading.Thread(target=self._ingest_worker, name="rag-ingest", daemon=True)
+                self._ingest_thread.start()
+            
+            if self._ingest_queue.maxsize and self._ingest_queue.maxsize - self._ingest_queue.qsize() < len(items):
+                raise queue.Full
+            for item in items:
+                self._ingest_queue.put_nowait(item)
+        
+        return [item["id"] for item in items]
+    
+    def _ingest_worker(self):
+        """Index queued documents, taking up to INGEST_BATCH_SIZE of them per batch."""
+        pending: Optional[Dict[str, Any]] = None
+        while True:
+            batch = [pending or self._ingest_queue.get()]
+            pending = None
+            
+            # A file queued twice must be replaced in order, so it starts the next batch instead
+            filenames = {batch[0]["filename"]}
+            while len(batch) < INGEST_BATCH_SIZE:
+                try:
+                    item = self._ingest_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item["filename"] in filenames:
+                    pending = item
+                    break
+                batch.append(item)
+                filenames.add(item["filename"])
+            
+            try:
+                self.process_documents(batch)
+            except Exception as e:
+                # The client already has these document ids; surface the failure to admins
+                message = f"Background indexing failed for {', '.join(sorted(filenames))}: {e}"
+                logger.error(message)
+                settings_service.log_error(message, component="RAG Service")
+            finally:
+                for _ in batch:
+                    self._ingest_queue.task_done()
+    
+    def prepare_csv_document(self, csv_content: str, filename: str) -> Dict[str, Any]:
+        """Build a `process_documents` item for CSV data, with one chunk per record."""
+        df = _read_property_csv(csv_content)
+        
+        # Convert every row to a text description in one vectorized pass;
+        # the raw CSV is kept as the stored document content
+        return {
+            "content": csv_content,
+            "filename": filename,
+            "content_type": "text/csv",
+            "metadata": {"total_records": len(df)},
+            "pre_chunked": self._create_property_descriptions(df)
+        }
+    
     def process_csv_data(self, csv_content: str, filename: str) -> str:
         """Process CSV data for RAG indexing."""
         try:
-            # Parse CSV content
-            df = pd.read_csv(pd.io.common.StringIO(csv_content))
-            
-            # Convert each row to a text description
-            processed_chunks = []
-            for index, row in df.iterrows():
-                # Create a readable description of the property
-                description = self._create_property_description(row)
-                processed_chunks.append(description)
-            
-            # Combine all descriptions
-            combined_content = "\n\n".join(processed_chunks)
-            
-            # Process as regular document
-            return self.process_document(
-                content=combined_content,
-                filename=filename,
-                content_type="text/csv",
-                metadata={"total_records": len(df)}
-            )
+            return self.process_documents([self.prepare_csv_document(csv_content, filename)])[0]
             
         except Exception as e:
             logger.error(f"Error processing CSV data: {e}")
             raise
     
-    def retrieve_documents(self, query: str, n_results: int = None) -> List[Dict[str, Any]]:
-        """Retrieve relevant documents based on query."""
+    def retrieve_documents(self, query: str, n_results: int = None,
+                           filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Retrieve relevant documents based on query, optionally restricted to chunks whose
+        metadata equals every value in `filters` (e.g. `{"filename": "listings.csv"}`)."""
         try:
             if n_results is None:
                 n_results = settings.max_retrieval_docs
+            cache_generation = self._cache_generation
             
-            # Query the vector database
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=n_results,
-                include=["documents", "metadatas", "distances"]
-            )
+            # Serve repeated queries straight from the exact-match cache (unfiltered queries only)
+            cache_key = (query.strip().lower(), n_results)
+            if not filters:
+                with self._cache_lock:
+                    cached_docs = self._query_cache.get(cache_key)
+                    if cached_docs is not None:
+                        self._query_cache.move_to_end(cache_key)
+                if cached_docs is not None:
+                    return list(cached_docs)
+            
+            # Embed the query with the same model used at ingest time (recent queries are cached)
+            query_embedding = _embed_query(query)
+            
+            # Near-duplicate queries reuse the results of an earlier, similar query
+            if not filters:
+                cached_docs = self._semantic_cache_lookup(query_embedding[0], n_results)
+                if cached_docs is not None:
+                    self._store_query_cache(cache_key, query_embedding[0], cached_docs, cache_generation)
+                    return list(cached_docs)
+            
+            if (self.vector_index is not None and self.vector_index.is_ready
+                    and (not filters or FaissIndex.supports_filters(filters))):
+                # Search the in-process FAISS mirror, then fetch the hits' text and metadata by id
+                with self._index_lock:
+                    hits = self.vector_index.search(query_embedding[0], n_results, filters)
+                items = self.collection.get(
+                    ids=[chunk_id for chunk_id, _ in hits],
+                    include=["documents", "metadatas"]
+                ) if hits else {'ids': [], 'documents': [], 'metadatas': []}
+                chunks = {
+                    chunk_id: (document, metadata)
+                    for chunk_id, document, metadata in zip(items['ids'], items['documents'], items['metadatas'])
+                }
+                
+                retrieved_docs = []
+                for chunk_id, score in hits:
+                    if chunk_id in chunks:
+                        retrieved_docs.append({
+                            "content": chunks[chunk_id][0],
+                            "metadata": chunks[chunk_id][1],
+                            "similarity_score": score  # Inner product of normalized vectors
+                        })
+            else:
+                # Query the vector database
+                where = None
+                if filters:
+                    where = filters if len(filters) == 1 else {"$and": [{field: value} for field, value in filters.items()]}
+                results = self.collection.query(
+                    query_embeddings=query_embedding.tolist(),
+                    n_results=n_results,
+                    where=where,
+                    include=["documents", "metadatas", "distances"]
+                )
+                
+                # Format results
+                retrieved_docs = []
+                if results['documents'] and results['documents'][0]:
+                    for i, doc in enumerate(results['documents'][0]):
+                        retrieved_docs.append({
+                            "content": doc,
+                            "metadata": results['metadatas'][0][i],
+                            "similarity_score": 1 - results['distances'][0][i]  # Chroma's ip distance is 1 - dot product
+                        })
             
-            # Format results
-            retrieved_docs = []
-            if results['documents'] and results['documents'][0]:
-                for i, doc in enumerate(results['documents'][0]):
-                    retrieved_docs.append({
-                        "content": doc,
-                        "metadata": results['metadatas'][0][i],
-                        "similarity_score": 1 - results['distances'][0][i]  # Convert distance to similarity
-                    })
+            if not filters:
+                self._store_query_cache(cache_key, query_embedding[0], retrieved_docs, cache_generation)
             
             logger.info(f"Retrieved {len(retrieved_docs)} documents for query: {query[:100]}...")
-            return retrieved_docs
+            return list(retrieved_docs)
             
         except Exception as e:
             logger.error(f"Error retrieving documents: {e}")
             return []
     
+    def _semantic_cache_lookup(self, query_embedding: np.ndarray, n_results: int) -> Optional[List[Dict[str, Any]]]:
+        """Return cached results for the most similar earlier query, if it is close enough."""
+        with self._cache_lock:
+            if self._semantic_cache_embeddings is None:
+                return None
+            
+            # Embeddings are normalized, so a dot product is the cosine similarity
+            scores = self._semantic_cache_embeddings @ query_embedding
+            scores[self._semantic_cache_sizes != n_results] = -1.0
+            best = int(np.argmax(scores))
+            
+            if scores[best] >= settings.semantic_cache_threshold:
+                return self._semantic_cache_results[best]
+            return None
+    
+    def _store_query_cache(self, cache_key: Tuple[str, int], query_embedding: np.ndarray,
+                           docs: List[Dict[str, Any]], generation: int):
+        """Remember retrieval results in both the exact-match and semantic caches, unless the
+        collection has changed since `generation` was read (the results may predate the change)."""
+        with self._cache_lock:
+            if generation != self._cache_generation:
+                return
+            
+            self._query_cache[cache_key] = docs
+            if len(self._query_cache) > settings.query_cache_size:
+                self._query_cache.popitem(last=False)
+            
+            # The semantic cache is a fixed-size ring buffer, so the oldest entry is evicted first
+            if self._semantic_cache_embeddings is None:
+                size = settings.semantic_cache_size
+                self._semantic_cache_embeddings = np.zeros((size, query_embedding.shape[0]), dtype=np.float32)
+                self._semantic_cache_sizes = np.zeros(size, dtype=np.int64)
+                self._semantic_cache_results = [None] * size
+                self._semantic_cache_next = 0
+            
+            slot = self._semantic_cache_next
+            self._semantic_cache_embeddings[slot] = query_embedding
+            self._semantic_cache_sizes[slot] = cache_key[1]
+            self._semantic_cache_results[slot] = docs
+            self._semantic_cache_next = (slot + 1) % len(self._semantic_cache_results)
+    
+    def _invalidate_query_cache(self):
+        """Drop cached retrieval results after the collection changes."""
+        with self._cache_lock:
+            self._cache_generation += 1
+            self._query_cache.clear()
+            self._semantic_cache_embeddings = None
+            self._semantic_cache_sizes = None
+            self._semantic_cache_results = []
+            self._semantic_cache_next = 0
+    
     def _split_text(self, text: str) -> List[str]:
         """Split text into chunks."""
         chunk_size = settings.chunk_size
         overlap = settings.chunk_overlap
+        text_length = len(text)
         
-        if len(text) <= chunk_size:
+        if text_length <= chunk_size:
             return [text]
         
+        # Index sentence and word boundaries once with a vectorized scan over the code points
+        # (one byte per character for ASCII text); each chunk then needs only a binary search
+        if text.isascii():
+            codes = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+        else:
+            codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        sentence_ends = np.flatnonzero(codes == ord('.')).tolist()
+        word_ends = np.flatnonzero(codes == ord(' ')).tolist()
+        
         chunks = []
         start = 0
         
-        while start < len(text):
+        while True:
             end = start + chunk_size
             
-            # If this isn't the last chunk, try to break at a sentence or word boundary
-            if end < len(text):
-                # Look for sentence boundary
-                sentence_end = text.rfind('.', start, end)
-                if sentence_end > start:
-                    end = sentence_end + 1
-                else:
-                    # Look for word boundary
-                    word_end = text.rfind(' ', start, end)
-                    if word_end > start:
-                        end = word_end
-            
-            chunks.append(text[start:end].strip())
-            start = end - overlap
-            
-            # Prevent infinite loop
-            if start >= len(text):
+            # The last chunk takes the rest of the text
+            if end >= text_length:
+                chunks.append(self._trimmed_slice(text, start, text_length))
                 break
+            
+            # Try to break at the last sentence boundary in the window, then at a word boundary
+            i = bisect.bisect_left(sentence_ends, end) - 1
+            if i >= 0 and sentence_ends[i] > start:
+                end = sentence_ends[i] + 1
+            else:
+                i = bisect.bisect_left(word_ends, end) - 1
+                if i >= 0 and word_ends[i] > start:
+                    end = word_ends[i]
+            
+            chunks.append(self._trimmed_slice(text, start, end))
+            
+            # Step back by the overlap, but never to or before the current start
+            start = end - overlap if end - overlap > start else end
         
         return chunks
     
-    def _create_property_description(self, row: pd.Series) -> str:
-        """Create a readable description from property data."""
+    @staticmethod
+    def _trimmed_slice(text: str, start: int, end: int) -> str:
+        """Return `text[start:end].strip()` with a single copy, by trimming the bounds first."""
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        return text[start:end]
+    
+    def _create_property_descriptions(self, df: pd.DataFrame) -> List[str]:
+        """Create readable descriptions for all property rows using column-wise string ops."""
         try:
-            description = f"Property at {row.get('Property Address', 'Unknown Address')}"
-            
-            if pd.notna(row.get('Floor')):
-                description += f" on floor {row.get('Floor')}"
-            
-            if pd.notna(row.get('Suite')):
-                description += f", suite {row.get('Suite')}"
-            
-            if pd.notna(row.get('Size (SF)')):
-                description += f". Size: {row.get('Size (SF)')} square feet"
+            fields = df.reindex(columns=PROPERTY_COLUMNS)
             
-            if pd.notna(row.get('Rent/SF/Year')):
-                rent = str(row.get('Rent/SF/Year')).replace('$', '').replace(',', '')
-                description += f". Rent: ${rent} per square foot per year"
+            def optional(column: str, prefix: str, values: Optional[pd.Series] = None, suffix: str = "") -> pd.Series:
+                """Render `prefix + value + suffix` where the column is present, else an empty string."""
+                if values is None:
+                    values = fields[column].astype(str)
+                return (prefix + values + suffix).where(fields[column].notna(), "")
             
-            if pd.notna(row.get('Annual Rent')):
-                description += f". Annual rent: {row.get('Annual Rent')}"
+            rent = fields['Rent/SF/Year'].astype(str).str.replace('$', '', regex=False).str.replace(',', '', regex=False)
             
-            if pd.notna(row.get('Monthly Rent')):
-                description += f". Monthly rent: {row.get('Monthly Rent')}"
+            # Add associates information: the first present associate is the primary agent
+            associates = fields[ASSOCIATE_COLUMNS].stack().dropna().astype(str)
+            by_row = associates.groupby(level=0)
+            primary = by_row.first().reindex(df.index)
+            additional = associates[by_row.cumcount() > 0].groupby(level=0).agg(', '.join).reindex(df.index)
             
-            if pd.notna(row.get('GCI On 3 Years')):
-                description += f". GCI on 3 years: {row.get('GCI On 3 Years')}"
+            # Join every part in a single concatenation pass instead of one temporary Series per part
+            description = ("Property at " + fields['Property Address'].fillna('Unknown Address').astype(str)).str.cat([
+                optional('Floor', " on floor "),
+                optional('Suite', ", suite "),
+                optional('Size (SF)', ". Size: ", suffix=" square feet"),
+                optional('Rent/SF/Year', ". Rent: $", values=rent, suffix=" per square foot per year"),
+                optional('Annual Rent', ". Annual rent: "),
+                optional('Monthly Rent', ". Monthly rent: "),
+                optional('GCI On 3 Years', ". GCI on 3 years: "),
+                # Add broker information
+                optional('BROKER Email ID', ". Broker email: "),
+                (". Primary agent: " + primary).where(primary.notna(), ""),
+                (". Additional associates: " + additional).where(additional.notna(), "")
+            ])
             
-            # Add broker information
-            if pd.notna(row.get('BROKER Email ID')):
-                description += f". Broker email: {row.get('BROKER Email ID')}"
-            
-            # Add associates information
-            associates = []
-            for i in range(1, 5):
-                associate_col = f'Associate {i}'
-                if pd.notna(row.get(associate_col)):
-                    associates.append(row.get(associate_col))
-            
-            if associates:
-                primary_associate = associates[0] if associates else None
-                if primary_associate:
-                    description += f". Primary agent: {primary_associate}"
-                
-                if len(associates) > 1:
-                    additional_associates = associates[1:]
-                    description += f". Additional associates: {', '.join(additional_associates)}"
-            
-            return description
+            return description.tolist()
             
         except Exception as e:
-            logger.error(f"Error creating property description: {e}")
-            return f"Property data: {row.to_dict()}"
+            logger.error(f"Error creating property descriptions: {e}")
+            return [f"Property data: {record}" for record in df.to_dict('records')]
     
     def list_documents(self, page: int = 1, per_page: int = 10) -> Dict[str, Any]:
         """List all active documents with pagination."""
@@ -348,6 +945,10 @@ class RAGService:
     
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the document collection."""
+        with self._stats_lock:
+            if self._stats_cache is not None and time.monotonic() - self._stats_cache[0] < settings.stats_cache_ttl:
+                return dict(self._stats_cache[1])
+        
         try:
             from database import get_db_context
             from models.crm_models import Document
@@ -368,14 +969,17 @@ class RAGService:
                 last_document = db.query(Document).filter(Document.is_active == True).order_by(Document.indexed_at.desc()).first()
                 last_updated = last_document.indexed_at.isoformat() if last_document and last_document.indexed_at else None
             
-            return {
+            stats = {
                 "total_documents": total_documents,
                 "total_chunks": total_chunks,
                 "collection_size": collection_size,
                 "last_updated": last_updated,
-                "collection_name": "knowledge_base",
+                "collection_name": COLLECTION_NAME,
                 "embedding_model": settings.embedding_model
             }
+            with self._stats_lock:
+                self._stats_cache = (time.monotonic(), stats)
+            return dict(stats)
         except Exception as e:
             logger.error(f"Error getting collection stats: {e}")
             return {
@@ -386,6 +990,19 @@ class RAGService:
                 "error": str(e)
             }
     
+    def _update_stats(self, documents: int = 0, chunks: int = 0, size: int = 0,
+                      last_updated: Optional[datetime] = None):
+        """Apply a write to the cached stats in place so they stay current between refreshes."""
+        with self._stats_lock:
+            if self._stats_cache is None:
+                return
+            stats = self._stats_cache[1]
+            stats["total_documents"] += documents
+            stats["total_chunks"] += chunks
+            stats["collection_size"] += size
+            if last_updated is not None:
+                stats["last_updated"] = last_updated.isoformat()
+    
     def clear_collection(self):
         """Clear all documents from the collection."""
         try:
@@ -393,17 +1010,21 @@ class RAGService:
             from models.crm_models import Document
             
             # Delete collection and recreate in ChromaDB
-            self.chroma_client.delete_collection("knowledge_base")
-            self.collection = self.chroma_client.get_or_create_collection(
-                name="knowledge_base",
-                metadata={"hnsw:space": "cosine"}
-            )
+            with self._index_lock:
+                self.chroma_client.delete_collection(COLLECTION_NAME)
+                self.collection = self._get_or_create_collection()
+                if self.vector_index is not None:
+                    self.vector_index.reset()
+                self._invalidate_query_cache()
             
             # Clear documents from database
             with get_db_context() as db:
                 db.query(Document).update({"is_active": False})
                 db.commit()
             
+            with self._stats_lock:
+                self._stats_cache = None
+            
             logger.info("Collection cleared successfully")
         except Exception as e:
             logger.error(f"Error clearing collection: {e}")
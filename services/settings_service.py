@@ -1,19 +1,35 @@
 import logging
 import os
+import time
+import threading
 import psutil
-from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
+from collections import deque
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Number of logged errors kept for the admin overview
+MAX_RECENT_ERRORS = 100
+
+# Seconds a resource usage sample is served before psutil is queried again
+RESOURCE_USAGE_TTL = 5
+
 class SettingsService:
     """Service class for system settings and configuration management."""
     
     def __init__(self):
         self.start_time = datetime.utcnow()
         self.version = "1.0.0"
-        self.recent_errors = []
+        self.recent_errors: deque = deque(maxlen=MAX_RECENT_ERRORS)
+        
+        # Resource usage is sampled at most once per RESOURCE_USAGE_TTL, however often it is polled
+        self._resource_usage: Optional[Tuple[float, Dict[str, Any]]] = None
+        self._resource_lock = threading.Lock()
+        
+        # Prime the CPU counter so later non-blocking calls report usage since the previous sample
+        psutil.cpu_percent(interval=None)
     
     def get_system_settings(self) -> Dict[str, Any]:
         """Get current system settings for admin viewing."""
@@ -163,9 +179,13 @@ class SettingsService:
     
     def _get_resource_usage(self) -> Dict[str, Any]:
         """Get system resource usage."""
+        with self._resource_lock:
+            if self._resource_usage is not None and time.monotonic() - self._resource_usage[0] < RESOURCE_USAGE_TTL:
+                return self._resource_usage[1]
+        
         try:
-            # CPU usage
-            cpu_percent = psutil.cpu_percent(interval=1)
+            # CPU usage since the previous sample (non-blocking)
+            cpu_percent = psutil.cpu_percent(interval=None)
             
             # Memory usage
             memory = psutil.virtual_memory()
@@ -173,7 +193,7 @@ class SettingsService:
             # Disk usage
             disk = psutil.disk_usage('/')
             
-            return {
+            usage = {
                 "cpu_percent": cpu_percent,
                 "memory": {
                     "total_mb": round(memory.total / (1024 * 1024), 2),
@@ -188,6 +208,9 @@ class SettingsService:
                     "percent": round((disk.used / disk.total) * 100, 2)
                 }
             }
+            with self._resource_lock:
+                self._resource_usage = (time.monotonic(), usage)
+            return usage
             
         except Exception as e:
             logger.error(f"Error getting resource usage: {e}")
@@ -199,22 +222,7 @@ class SettingsService:
     
     def _get_recent_errors(self) -> list:
         """Get recent system errors."""
-        # In a real implementation, this would read from a logging system
-        # For now, return placeholder data
-        return [
-            {
-                "timestamp": (datetime.utcnow() - timedelta(hours=2)).isoformat(),
-                "level": "ERROR",
-                "message": "Failed to process document upload",
-                "component": "RAG Service"
-            },
-            {
-                "timestamp": (datetime.utcnow() - timedelta(hours=5)).isoformat(),
-                "level": "WARNING",
-                "message": "High memory usage detected",
-                "component": "System Monitor"
-            }
-        ]
+        return list(self.recent_errors)
     
     def _get_uptime(self) -> str:
         """Get system uptime."""
@@ -268,11 +276,8 @@ class SettingsService:
             "message": error,
             "component": component
         }
+        # The deque drops the oldest entry once MAX_RECENT_ERRORS are kept
         self.recent_errors.append(error_entry)
-        
-        # Keep only last 100 errors
-        if len(self.recent_errors) > 100:
-            self.recent_errors = self.recent_errors[-100:]
 
 # Global settings service instance
 settings_service = SettingsService() 
\ No newline at end of file
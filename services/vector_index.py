@@ -0,0 +1,480 @@
+import os
+import math
+import time
+import hashlib
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Set, Tuple
+import numpy as np
+from config import settings
+
+try:
+    import faiss
+except ImportError:  # FAISS is optional; retrieval falls back to ChromaDB without it
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+# IVF sizing: cells grow with sqrt(corpus size), and each needs ~39 training points
+IVF_MIN_NLIST = 64
+IVF_MAX_NLIST = 4096
+IVF_MIN_POINTS_PER_CELL = 39
+
+# HNSW graph: neighbours per node, and candidate list size while inserting
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+
+# Chunk metadata fields that searches can be filtered on
+FILTER_FIELDS = ("filename", "content_type")
+
+# Write-ahead log record types: [op, count] header, then ids (and float32 vectors for adds).
+# A log starts with a [WAL_CHECKPOINT, checkpoint id] record naming the checkpoint it extends.
+WAL_ADD = 1
+WAL_REMOVE = 2
+WAL_CHECKPOINT = 3
+
+def chunk_id_to_faiss_id(chunk_id: str) -> int:
+    """Map a chunk id to a stable, non-negative int64 FAISS id (stable across processes)."""
+    digest = hashlib.blake2b(chunk_id.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') & 0x7FFFFFFFFFFFFFFF
+
+def checkpoint_id(data: np.ndarray) -> int:
+    """Identify a serialized checkpoint by a hash of its bytes (0 means no checkpoint)."""
+    return int(np.frombuffer(hashlib.blake2b(data, digest_size=8).digest(), dtype=np.int64)[0]) or 1
+
+def ivf_nlist(n_vectors: int) -> int:
+    """Number of IVF cells for a corpus of the given size (about 4 * sqrt(N), clamped)."""
+    return min(IVF_MAX_NLIST, max(IVF_MIN_NLIST, int(4 * math.sqrt(n_vectors))))
+
+def base_index(index):
+    """The underlying flat, HNSW or IVF index, unwrapping an id map if there is one."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return faiss.downcast_index(index)
+
+def index_ids(index) -> np.ndarray:
+    """All FAISS ids stored in an index."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    
+    # IVF indexes store the ids themselves, in their inverted lists
+    invlists = faiss.downcast_index(index).invlists
+    ids = [
+        faiss.rev_swig_ptr(invlists.get_ids(cell), invlists.list_size(cell)).copy()
+        for cell in range(invlists.nlist) if invlists.list_size(cell)
+    ]
+    return np.concatenate(ids).astype(np.int64) if ids else np.empty(0, dtype=np.int64)
+
+class FaissIndex:
+    """In-process FAISS mirror of the knowledge base collection for fast retrieval."""
+    
+    def __init__(self, dimension: int, index_path: str):
+        self.dimension = dimension
+        self.index_path = index_path
+        self.wal_path = index_path + ".wal"
+        
+        # Small corpora are searched exactly with a flat inner-product index. Once there are
+        # enough vectors to train it, the index is rebuilt as IVF with compressed codes: 8-bit
+        # product quantization ("ivfpq") or per-dimension int8 scalar quantization ("ivfsq8").
+        # "hnsw" uses a graph index from the start (no training, full-precision vectors), and
+        # "flat" always searches exactly. Flat and HNSW indexes are wrapped in IndexIDMap2 so
+        # chunks can be addressed and removed by id; IVF indexes store the ids natively (an id
+        # map over IVF goes out of sync on removal, as IVF does not renumber its entries).
+        self.index = self._new_index()
+        
+        # Only the chunk ids are kept in memory; chunk text and metadata stay in ChromaDB's store
+        self.chunk_ids: Dict[int, str] = {}
+        
+        # Filterable metadata as one column per field (structure of arrays): row i of every
+        # column describes the chunk with FAISS id `_row_ids[i]`. String values are stored as
+        # int32 codes so a filter is a single vectorized comparison over a contiguous array.
+        self._row_ids = np.empty(0, dtype=np.int64)
+        self._columns: Dict[str, np.ndarray] = {field: np.empty(0, dtype=np.int32) for field in FILTER_FIELDS}
+        self._codes: Dict[str, Dict[Any, int]] = {field: {} for field in FILTER_FIELDS}
+        
+        # The index file is a periodic checkpoint; changes made since then are appended to a
+        # write-ahead log, so saving after each document writes only that document's vectors
+        self._unsaved: List[Tuple[int, np.ndarray, Optional[np.ndarray]]] = []
+        self._wal_vectors = 0
+        self._checkpoint_due = False
+        self._checkpoint_id = 0
+        self._last_checkpoint = time.monotonic()
+        self._save_lock = threading.Lock()
+        
+        # HNSW graphs cannot delete nodes, so removed ids stay in the graph as tombstones that
+        # searches skip, until the next checkpoint compacts them away
+        self._tombstones: Set[int] = set()
+    
+    @staticmethod
+    def available() -> bool:
+        """Whether the faiss package is installed."""
+        return faiss is not None
+    
+    @staticmethod
+    def compile_options() -> str:
+        """SIMD level the loaded faiss build was compiled for (e.g. "AVX2", "AVX512")."""
+        return faiss.get_compile_options()
+    
+    @property
+    def is_ready(self) -> bool:
+        """Whether the index holds any vectors to search."""
+        return self.index.ntotal > len(self._tombstones)
+    
+    @property
+    def is_trained_ivf(self) -> bool:
+        """Whether the index has been rebuilt as a trained IVF index."""
+        return isinstance(base_index(self.index), faiss.IndexIVF)
+    
+    @property
+    def is_hnsw(self) -> bool:
+        """Whether the index is an HNSW graph."""
+        return isinstance(base_index(self.index), faiss.IndexHNSW)
+    
+    def _new_index(self):
+        """Create the empty starting index for the configured `faiss_index_type`."""
+        if settings.faiss_index_type == "hnsw":
+            return self._new_hnsw_index()
+        return self._new_flat_index()
+    
+    def _new_flat_index(self):
+        """Create an exact inner-product index with id mapping."""
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+    
+    def _new_hnsw_index(self):
+        """Create an HNSW inner-product index with id mapping."""
+        hnsw = faiss.IndexHNSWFlat(self.dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        hnsw.hnsw.efSearch = settings.faiss_ef_search
+        return faiss.IndexIDMap2(hnsw)
+    
+    @staticmethod
+    def _ivf_class():
+        """IVF index class for the configured `faiss_index_type`."""
+        if settings.faiss_index_type == "ivfsq8":
+            return faiss.IndexIVFScalarQuantizer
+        return faiss.IndexIVFPQ
+    
+    def _new_ivf_index(self, n_vectors: int):
+        """Create an untrained IVF index, sized for n_vectors."""
+        quantizer = faiss.IndexFlatIP(self.dimension)
+        if self._ivf_class() is faiss.IndexIVFScalarQuantizer:
+            # int8 codes with per-dimension ranges learned from the training vectors
+            ivf = faiss.IndexIVFScalarQuantizer(
+                quantizer, self.dimension, ivf_nlist(n_vectors),
+                faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+        else:
+            ivf = faiss.IndexIVFPQ(
+                quantizer, self.dimension, ivf_nlist(n_vectors),
+                self.dimension // 8 or 8, 8, faiss.METRIC_INNER_PRODUCT
+            )
+        ivf.nprobe = settings.faiss_nprobe
+        return ivf
+    
+    def _maybe_train(self):
+        """Rebuild the flat index as IVF once it has enough vectors to train on."""
+        n_vectors = self.index.ntotal
+        if (settings.faiss_index_type in ("flat", "hnsw") or self.is_trained_ivf
+                or n_vectors < IVF_MIN_POINTS_PER_CELL * ivf_nlist(n_vectors)):
+            return
+        
+        ids = index_ids(self.index)
+        embeddings = self.index.index.reconstruct_n(0, n_vectors)
+        
+        index = self._new_ivf_index(n_vectors)
+        index.train(embeddings)
+        index.add_with_ids(embeddings, ids)
+        
+        self.index = index
+        self._checkpoint_due = True  # The log cannot be replayed onto the old flat checkpoint
+        logger.info(f"Trained FAISS {settings.faiss_index_type} index with {ivf_nlist(n_vectors)} cells on {n_vectors} vectors")
+    
+    def load(self, chunk_ids: List[str]) -> bool:
+        """Load the persisted index and replay its log, if the result holds exactly the given chunks."""
+        # Until a load succeeds, the first save must replace whatever is on disk
+        self._checkpoint_due = True
+        
+        if os.path.exists(self.index_path):
+            try:
+                data = np.fromfile(self.index_path, dtype=np.uint8)
+                index = faiss.deserialize_index(data)
+            except Exception as e:
+                logger.warning(f"Could not read FAISS index {self.index_path}: {e}")
+                return False
+            checkpoint = checkpoint_id(data)
+        elif os.path.exists(self.wal_path):
+            index = self._new_index()
+            checkpoint = 0
+        else:
+            return False
+        
+        if index.d != self.dimension:
+            logger.info("Persisted FAISS index has a different dimension, rebuilding")
+            return False
+        
+        inner_index = base_index(index)
+        if isinstance(inner_index, faiss.IndexIVF):
+            # IVF checkpoints wrapped in an id map (older versions) may hold stale id mappings
+            matches = (settings.faiss_index_type not in ("flat", "hnsw") and not isinstance(index, faiss.IndexIDMap)
+                       and isinstance(inner_index, self._ivf_class()))
+        elif isinstance(inner_index, faiss.IndexHNSW):
+            matches = settings.faiss_index_type == "hnsw"
+        else:
+            matches = settings.faiss_index_type != "hnsw"
+        if not matches:
+            logger.info(f"Persisted FAISS index does not match faiss_index_type={settings.faiss_index_type}, rebuilding")
+            return False
+        
+        if isinstance(inner_index, faiss.IndexIVF):
+            inner_index.nprobe = settings.faiss_nprobe
+        elif isinstance(inner_index, faiss.IndexHNSW):
+            inner_index.hnsw.efSearch = settings.faiss_ef_search
+        
+        self.index = index
+        self._tombstones = set()
+        self._checkpoint_id = checkpoint
+        self._checkpoint_due = False
+        self._wal_vectors = self._replay_wal()
+        
+        # Compare counts as well as id sets, so vectors added twice are caught
+        expected_ids = {chunk_id_to_faiss_id(chunk_id) for chunk_id in chunk_ids}
+        ids = self._live_ids()
+        if len(ids) != len(expected_ids) or set(ids.tolist()) != expected_ids:
+            logger.info("Persisted FAISS index is out of date, rebuilding")
+            self.index = self._new_index()
+            self._tombstones = set()
+            self._wal_vectors = 0
+            self._checkpoint_due = True
+            return False
+        
+        return True
+    
+    def _replay_wal(self) -> int:
+        """Apply the logged changes to the loaded checkpoint; returns the number of vectors replayed."""
+        if not os.path.exists(self.wal_path):
+            return 0
+        
+        replayed = 0
+        with open(self.wal_path, 'r+b') as wal:
+            # A log left behind by a checkpoint that was interrupted before deleting it describes
+            # changes the newer checkpoint already holds
+            header = np.fromfile(wal, dtype=np.int64, count=2)
+            if len(header) < 2 or header[0] != WAL_CHECKPOINT or header[1] != self._checkpoint_id:
+                logger.info("FAISS log does not extend the persisted checkpoint, discarding it")
+                replayed = None
+            else:
+                end = wal.tell()
+                while True:
+                    header = np.fromfile(wal, dtype=np.int64, count=2)
+                    if len(header) < 2:
+                        break
+                    op, count = int(header[0]), int(header[1])
+                    
+                    ids = np.fromfile(wal, dtype=np.int64, count=count)
+                    if op == WAL_ADD:
+                        embeddings = np.fromfile(wal, dtype=np.float32, count=count * self.dimension)
+                        if len(ids) < count or len(embeddings) < count * self.dimension:
+                            break  # Torn write at the end of the log
+                        self._add_ids(ids, embeddings.reshape(count, self.dimension))
+                        self._maybe_train()
+                    elif op == WAL_REMOVE and len(ids) == count:
+                        self._remove_ids(ids)
+                    else:
+                        break
+                    replayed += count
+                    end = wal.tell()
+                
+                # Cut off a torn record so later appends follow the last complete one
+                wal.truncate(end)
+        
+        if replayed is None:
+            os.remove(self.wal_path)
+            return 0
+        return replayed
+    
+    def save(self):
+        """Persist changes since the last save: append them to the log, or write a full checkpoint
+        once enough vectors have been logged or enough time has passed."""
+        with self._save_lock:
+            pending = sum(len(ids) for _, ids, _ in self._unsaved)
+            if (self._checkpoint_due
+                    or self._wal_vectors + pending >= settings.faiss_checkpoint_vectors
+                    or time.monotonic() - self._last_checkpoint >= settings.faiss_checkpoint_seconds):
+                self._checkpoint()
+            else:
+                self._append_wal()
+    
+    def _append_wal(self):
+        """Append the unsaved changes to the write-ahead log."""
+        if not self._unsaved:
+            return
+        
+        os.makedirs(os.path.dirname(self.wal_path) or ".", exist_ok=True)
+        with open(self.wal_path, 'ab') as wal:
+            if wal.tell() == 0:
+                wal.write(np.array([WAL_CHECKPOINT, self._checkpoint_id], dtype=np.int64).tobytes())
+            for op, ids, embeddings in self._unsaved:
+                wal.write(np.array([op, len(ids)], dtype=np.int64).tobytes())
+                wal.write(ids.tobytes())
+                if embeddings is not None:
+                    wal.write(embeddings.tobytes())
+                self._wal_vectors += len(ids)
+        self._unsaved = []
+    
+    def _checkpoint(self):
+        """Compact away tombstones, write the whole index and start a new, empty log."""
+        self._compact()
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        data = faiss.serialize_index(self.index)
+        data.tofile(tmp_path)
+        os.replace(tmp_path, self.index_path)
+        
+        # From here the old log no longer matches the checkpoint, even if deleting it fails
+        self._checkpoint_id = checkpoint_id(data)
+        if os.path.exists(self.wal_path):
+            os.remove(self.wal_path)
+        
+        self._unsaved = []
+        self._wal_vectors = 0
+        self._checkpoint_due = False
+        self._last_checkpoint = time.monotonic()
+    
+    def register(self, chunk_ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Register chunk ids and filterable metadata without adding vectors (used after `load`)."""
+        ids = np.array([chunk_id_to_faiss_id(chunk_id) for chunk_id in chunk_ids], dtype=np.int64)
+        self.chunk_ids.update(zip(ids.tolist(), chunk_ids))
+        
+        self._row_ids = np.concatenate([self._row_ids, ids])
+        for field in FILTER_FIELDS:
+            codes = self._codes[field]
+            column = np.fromiter(
+                (codes.setdefault(metadata.get(field), len(codes)) for metadata in metadatas),
+                dtype=np.int32, count=len(metadatas)
+            )
+            self._columns[field] = np.concatenate([self._columns[field], column])
+        return ids
+    
+    def add(self, chunk_ids: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]]):
+        """Add chunk vectors, switching to IVF once the corpus is large enough to train it."""
+        ids = self.register(chunk_ids, metadatas)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self._add_ids(ids, embeddings)
+        self._unsaved.append((WAL_ADD, ids, embeddings))
+        self._maybe_train()
+    
+    def remove(self, chunk_ids: List[str]):
+        """Remove chunks by their chunk ids."""
+        ids = np.array([chunk_id_to_faiss_id(chunk_id) for chunk_id in chunk_ids], dtype=np.int64)
+        for faiss_id in ids.tolist():
+            self.chunk_ids.pop(faiss_id, None)
+        
+        keep = ~np.isin(self._row_ids, ids)
+        self._row_ids = self._row_ids[keep]
+        for field in FILTER_FIELDS:
+            self._columns[field] = self._columns[field][keep]
+        
+        self._remove_ids(ids)
+        self._unsaved.append((WAL_REMOVE, ids, None))
+    
+    def _add_ids(self, ids: np.ndarray, embeddings: np.ndarray):
+        """Add vectors by FAISS id."""
+        # A re-added id must not be left behind its own tombstone
+        if self._tombstones and not self._tombstones.isdisjoint(ids.tolist()):
+            self._compact()
+        self.index.add_with_ids(embeddings, ids)
+    
+    def _remove_ids(self, ids: np.ndarray):
+        """Remove vectors by FAISS id (tombstoned in HNSW graphs)."""
+        if self.is_hnsw:
+            self._tombstones.update(ids.tolist())
+        else:
+            self.index.remove_ids(ids)
+    
+    def _live_ids(self) -> np.ndarray:
+        """FAISS ids of the vectors in the index that have not been removed."""
+        ids = index_ids(self.index)
+        if self._tombstones:
+            ids = ids[~np.isin(ids, np.fromiter(self._tombstones, dtype=np.int64))]
+        return ids
+    
+    def _compact(self):
+        """Rebuild the HNSW graph without its tombstoned vectors."""
+        if not self._tombstones:
+            return
+        
+        all_ids = index_ids(self.index)
+        keep = ~np.isin(all_ids, np.fromiter(self._tombstones, dtype=np.int64))
+        embeddings = self.index.index.reconstruct_n(0, self.index.ntotal)[keep]
+        index = self._new_hnsw_index()
+        if len(embeddings):
+            index.add_with_ids(embeddings, all_ids[keep])
+        self.index = index
+        self._tombstones = set()
+    
+    def reset(self):
+        """Drop all vectors, chunk ids and metadata, including the persisted index and log."""
+        self.index = self._new_index()
+        self._tombstones = set()
+        self._unsaved = []
+        self._wal_vectors = 0
+        self._checkpoint_due = False
+        self._checkpoint_id = 0
+        self.chunk_ids = {}
+        self._row_ids = np.empty(0, dtype=np.int64)
+        self._columns = {field: np.empty(0, dtype=np.int32) for field in FILTER_FIELDS}
+        self._codes = {field: {} for field in FILTER_FIELDS}
+        for path in (self.index_path, self.wal_path):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    @staticmethod
+    def supports_filters(filters: Dict[str, Any]) -> bool:
+        """Whether every filter field is one this index keeps a column for."""
+        return all(field in FILTER_FIELDS for field in filters)
+    
+    def _select(self, filters: Dict[str, Any]) -> np.ndarray:
+        """FAISS ids of the chunks whose metadata equals every filter value."""
+        mask = np.ones(len(self._row_ids), dtype=bool)
+        for field, value in filters.items():
+            code = self._codes[field].get(value)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= self._columns[field] == code
+        return self._row_ids[mask]
+    
+    def search(self, query_embedding: np.ndarray, n_results: int,
+               filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Return (chunk id, inner product score) pairs for the closest chunks matching `filters`."""
+        query = np.ascontiguousarray(query_embedding.reshape(1, -1), dtype=np.float32)
+        
+        if filters:
+            selected_ids = self._select(filters)
+            if not len(selected_ids):
+                return []
+            
+            # Restrict the search to the selected chunks
+            selector = faiss.IDSelectorBatch(selected_ids)
+            if self.is_trained_ivf:
+                params = faiss.SearchParametersIVF(sel=selector, nprobe=settings.faiss_nprobe)
+            elif self.is_hnsw:
+                params = faiss.SearchParametersHNSW(sel=selector, efSearch=settings.faiss_ef_search)
+            else:
+                params = faiss.SearchParameters(sel=selector)
+            scores, ids = self.index.search(query, n_results, params=params)
+        elif self._tombstones:
+            # The selected ids above never include removed chunks; otherwise skip the tombstones
+            removed = faiss.IDSelectorBatch(np.fromiter(self._tombstones, dtype=np.int64))
+            selector = faiss.IDSelectorNot(removed)
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=settings.faiss_ef_search)
+            scores, ids = self.index.search(query, n_results, params=params)
+        else:
+            scores, ids = self.index.search(query, n_results)
+        
+        hits = []
+        for score, faiss_id in zip(scores[0].tolist(), ids[0].tolist()):
+            chunk_id = self.chunk_ids.get(faiss_id)
+            if faiss_id < 0 or chunk_id is None:
+                continue
+            hits.append((chunk_id, score))
+        return hits
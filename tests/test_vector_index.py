@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from config import settings
+from services import vector_index
+from services.vector_index import FaissIndex
+
+DIMENSION = 32
+N_VECTORS = 1200
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((N_VECTORS, DIMENSION)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def small_ivf(monkeypatch):
+    # Few cells, so the index trains on a small corpus and nprobe covers every cell
+    monkeypatch.setattr(vector_index, "IVF_MIN_NLIST", 4)
+    monkeypatch.setattr(vector_index, "IVF_MAX_NLIST", 4)
+    monkeypatch.setattr(settings, "faiss_nprobe", 4)
+
+
+@pytest.mark.parametrize("index_type", ["ivfpq", "ivfsq8"])
+def test_remove_then_search_on_trained_index(tmp_path, monkeypatch, small_ivf, vectors, index_type):
+    monkeypatch.setattr(settings, "faiss_index_type", index_type)
+    chunk_ids = [f"c{i}" for i in range(N_VECTORS)]
+    metadatas = [{"filename": f"f{i % 3}.txt", "content_type": "text/plain"} for i in range(N_VECTORS)]
+
+    index = FaissIndex(DIMENSION, str(tmp_path / "faiss.index"))
+    index.add(chunk_ids, vectors, metadatas)
+    assert index.is_trained_ivf
+
+    index.remove(chunk_ids[1000:1010])
+
+    assert index.search(vectors[1100], 1)[0][0] == "c1100"
+    assert index.search(vectors[1100], 1, filters={"filename": "f2.txt"})[0][0] == "c1100"
+
+    # The persisted index resolves ids the same way
+    index.save()
+    remaining = chunk_ids[:1000] + chunk_ids[1010:]
+    reloaded = FaissIndex(DIMENSION, str(tmp_path / "faiss.index"))
+    assert reloaded.load(remaining)
+    reloaded.register(remaining, metadatas[:1000] + metadatas[1010:])
+    assert reloaded.search(vectors[1100], 1)[0][0] == "c1100"
+
+
+@pytest.fixture
+def wal_only(monkeypatch):
+    # Saves append to the log until a checkpoint is forced
+    monkeypatch.setattr(settings, "faiss_index_type", "flat")
+    monkeypatch.setattr(settings, "faiss_checkpoint_vectors", 10 ** 6)
+    monkeypatch.setattr(settings, "faiss_checkpoint_seconds", 10 ** 6)
+
+
+def test_log_left_by_interrupted_checkpoint_is_not_replayed(tmp_path, monkeypatch, wal_only, vectors):
+    path = str(tmp_path / "faiss.index")
+    chunk_ids = [f"c{i}" for i in range(50)]
+
+    index = FaissIndex(DIMENSION, path)
+    index.add(chunk_ids, vectors[:50], [{}] * 50)
+    index.save()
+
+    # Crash after the new checkpoint replaced the old one, before the log was deleted
+    def crash(_path):
+        raise SystemExit("crash")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(vector_index.os, "remove", crash)
+        with pytest.raises(SystemExit):
+            index._checkpoint()
+
+    reloaded = FaissIndex(DIMENSION, path)
+    assert reloaded.load(chunk_ids)
+    assert reloaded.index.ntotal == 50
+
+
+def test_torn_log_tail_is_dropped(tmp_path, wal_only, vectors):
+    path = str(tmp_path / "faiss.index")
+    chunk_ids = [f"c{i}" for i in range(40)]
+
+    index = FaissIndex(DIMENSION, path)
+    index.add(chunk_ids[:20], vectors[:20], [{}] * 20)
+    index.save()
+    index.add(chunk_ids[20:30], vectors[20:30], [{}] * 10)
+    index.save()
+
+    # A write cut short at the end of the log
+    with open(path + ".wal", "r+b") as wal:
+        wal.truncate(wal.seek(0, 2) - 5)
+
+    reloaded = FaissIndex(DIMENSION, path)
+    assert reloaded.load(chunk_ids[:20])
+    reloaded.register(chunk_ids[:20], [{}] * 20)
+
+    # Records appended after the torn one are replayed on the next load
+    reloaded.add(chunk_ids[30:40], vectors[30:40], [{}] * 10)
+    reloaded.save()
+    assert FaissIndex(DIMENSION, path).load(chunk_ids[:20] + chunk_ids[30:40])
+
+
+def test_hnsw_removals_are_tombstoned_until_checkpoint(tmp_path, monkeypatch, wal_only, vectors):
+    monkeypatch.setattr(settings, "faiss_index_type", "hnsw")
+    path = str(tmp_path / "faiss.index")
+    chunk_ids = [f"c{i}" for i in range(100)]
+    remaining = chunk_ids[:40] + chunk_ids[50:]
+
+    index = FaissIndex(DIMENSION, path)
+    index.add(chunk_ids, vectors[:100], [{}] * 100)
+    index.save()
+    index.remove(chunk_ids[40:50])
+    index.save()
+
+    # The removed vectors stay in the graph but are never returned
+    assert index.index.ntotal == 100
+    assert "c45" not in [chunk_id for chunk_id, _ in index.search(vectors[45], 10)]
+
+    # Replaying the log tombstones the removed ids again
+    reloaded = FaissIndex(DIMENSION, path)
+    assert reloaded.load(remaining)
+    reloaded.register(remaining, [{}] * 90)
+    assert "c45" not in [chunk_id for chunk_id, _ in reloaded.search(vectors[45], 10)]
+
+    # A checkpoint compacts them out of the graph
+    reloaded._checkpoint()
+    assert reloaded.index.ntotal == 90
+    assert FaissIndex(DIMENSION, path).load(remaining)